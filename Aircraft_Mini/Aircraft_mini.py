@@ -1,30 +1,131 @@
+import math
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 from mpl_toolkits.mplot3d import Axes3D
 
-# Create figure and 3D axis
-fig = plt.figure(figsize=(12, 9))
-ax = fig.add_subplot(111, projection='3d')
+# Number of past positions drawn behind each aircraft
+TRAIL_LENGTH = 30
 
 # Time parameters
 t = np.linspace(0, 4*np.pi, 200)
 
-# Aircraft 1 trajectory (pursuing)
-x1 = 30 * np.cos(t)
-y1 = 30 * np.sin(t)
-z1 = 5 * np.sin(2*t) + 20
+# cos(pi/4) == sin(pi/4), so one factor covers both angle-sum terms
+K = 25 / math.sqrt(2)
+
+def trajectory_terms(ct, st, c2t, s2t, c3t, s3t):
+    """x1, y1, z1, x2, y2, z2 at one time step from the shared trig terms (Numba kernel)."""
+    return (30*ct, 30*st, 5*s2t + 20,                   # Aircraft 1 (pursuing)
+            K*(ct - st) + 10*s3t, K*(st + ct) + 10*c3t,  # Aircraft 2 (evading):
+            8*c2t + 25)                                  # 25*cos/sin(t + pi/4) via angle-sum
+
+def compute_trajectories(t, traj):
+    """Fill the (6, N) buffer ``traj`` with x1, y1, z1, x2, y2, z2 at times ``t``."""
+    x1, y1, z1, x2, y2, z2 = traj
+
+    # Shared trig terms, evaluated once and reused by both aircraft
+    ct, st = np.cos(t), np.sin(t)
+    tk = np.multiply(2, t)
+    c2t, s2t = np.cos(tk), np.sin(tk)
+    np.multiply(3, t, out=tk)
+    c3t, s3t = np.cos(tk), np.sin(tk)
+
+    # Same formulas as trajectory_terms, written in place row by row
+    # Aircraft 1 trajectory (pursuing)
+    np.multiply(30, ct, out=x1)
+    np.multiply(30, st, out=y1)
+    np.multiply(5, s2t, out=z1)
+    z1 += 20
+
+    # Aircraft 2 trajectory (evading)
+    # 25*cos(t + pi/4) and 25*sin(t + pi/4) via the angle-sum identity
+    np.subtract(ct, st, out=x2)
+    x2 *= K
+    s3t *= 10
+    x2 += s3t
+    np.add(st, ct, out=y2)
+    y2 *= K
+    c3t *= 10
+    y2 += c3t
+    np.multiply(8, c2t, out=z2)
+    z2 += 25
+
+# Use a compiled, multithreaded kernel when Numba is installed
+try:
+    import numba
+except ImportError:
+    numba = None
+
+if numba is not None:
+    # Same formulas as above, compiled for scalar use inside the parallel loop
+    _trajectory_point = numba.njit(fastmath=True, cache=True)(trajectory_terms)
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _compute_trajectories_numba(t, traj):
+        for i in numba.prange(t.shape[0]):
+            ti = t[i]
+            point = _trajectory_point(math.cos(ti), math.sin(ti), math.cos(2*ti),
+                                      math.sin(2*ti), math.cos(3*ti), math.sin(3*ti))
+            for j in range(6):
+                traj[j, i] = point[j]
+
+    # The two paths spell the formulas out separately; check they agree before switching
+    _t = np.linspace(0, 4*np.pi, 16)
+    _expected, _compiled = np.empty((6, 16)), np.empty((6, 16))
+    compute_trajectories(_t, _expected)
+    _compute_trajectories_numba(_t, _compiled)
+    assert np.allclose(_expected, _compiled), "Numba and NumPy trajectories disagree"
+    compute_trajectories = _compute_trajectories_numba
+
+# All six coordinate rows live in one preallocated buffer
+traj = np.empty((6, len(t)))
+compute_trajectories(t, traj)
+x1, y1, z1, x2, y2, z2 = traj
+
+def run_vispy():
+    """Render the same trajectories on the GPU with VisPy (optional dependency)."""
+    from vispy import app, scene
 
-# Aircraft 2 trajectory (evading)
-x2 = 25 * np.cos(t + np.pi/4) + 10 * np.sin(3*t)
-y2 = 25 * np.sin(t + np.pi/4) + 10 * np.cos(3*t)
-z2 = 8 * np.cos(2*t) + 25
+    canvas = scene.SceneCanvas(keys='interactive', size=(1200, 900), show=True,
+                               title='Aircraft Dogfight Simulation')
+    view = canvas.central_widget.add_view()
+    view.camera = scene.TurntableCamera(elevation=20, azimuth=0, distance=120)
+    view.camera.center = (0, 0, 20)
+    scene.visuals.XYZAxis(parent=view.scene)
 
-# Initialize plot elements
-line1, = ax.plot([], [], [], 'r-', linewidth=2, alpha=0.6, label='Aircraft 1')
-line2, = ax.plot([], [], [], 'b-', linewidth=2, alpha=0.6, label='Aircraft 2')
-point1, = ax.plot([], [], [], 'ro', markersize=10)
-point2, = ax.plot([], [], [], 'bo', markersize=10)
+    pos1 = np.column_stack((x1, y1, z1))
+    pos2 = np.column_stack((x2, y2, z2))
+    line1 = scene.visuals.Line(pos=pos1[:2], color=(1, 0, 0, 0.6), width=2, parent=view.scene)
+    line2 = scene.visuals.Line(pos=pos2[:2], color=(0, 0, 1, 0.6), width=2, parent=view.scene)
+    point1 = scene.visuals.Markers(parent=view.scene)
+    point2 = scene.visuals.Markers(parent=view.scene)
+
+    def on_timer(event):
+        frame = event.iteration % len(t) + 1
+        start_idx = max(0, frame - TRAIL_LENGTH)
+        line1.set_data(pos=pos1[start_idx:frame])
+        line2.set_data(pos=pos2[start_idx:frame])
+        point1.set_data(pos1[frame-1:frame], face_color='red', size=10)
+        point2.set_data(pos2[frame-1:frame], face_color='blue', size=10)
+
+    timer = app.Timer(interval=0.05, connect=on_timer, start=True)
+    app.run()
+
+if '--vispy' in sys.argv:
+    run_vispy()
+    sys.exit(0)
+
+# Create figure and 3D axis
+fig = plt.figure(figsize=(12, 9))
+ax = fig.add_subplot(111, projection='3d')
+
+# Initialize plot elements (empty arrays, so no separate init pass is needed)
+empty = np.empty(0)
+line1, = ax.plot(empty, empty, empty, 'r-', linewidth=2, alpha=0.6, label='Aircraft 1')
+line2, = ax.plot(empty, empty, empty, 'b-', linewidth=2, alpha=0.6, label='Aircraft 2')
+point1, = ax.plot(empty, empty, empty, 'ro', markersize=10)
+point2, = ax.plot(empty, empty, empty, 'bo', markersize=10)
 
 # Set axis limits
 ax.set_xlim([-40, 40])
@@ -39,21 +140,8 @@ ax.legend()
 # Add grid
 ax.grid(True, alpha=0.3)
 
-def init():
-    line1.set_data([], [])
-    line1.set_3d_properties([])
-    line2.set_data([], [])
-    line2.set_3d_properties([])
-    point1.set_data([], [])
-    point1.set_3d_properties([])
-    point2.set_data([], [])
-    point2.set_3d_properties([])
-    return line1, line2, point1, point2
-
 def update(frame):
-    # Trail length
-    trail_length = 30
-    start_idx = max(0, frame - trail_length)
+    start_idx = max(0, frame - TRAIL_LENGTH)
     
     # Update trails
     line1.set_data(x1[start_idx:frame], y1[start_idx:frame])
@@ -64,20 +152,28 @@ def update(frame):
     
     # Update current positions
     if frame > 0:
-        point1.set_data([x1[frame-1]], [y1[frame-1]])
-        point1.set_3d_properties([z1[frame-1]])
+        point1.set_data(x1[frame-1:frame], y1[frame-1:frame])
+        point1.set_3d_properties(z1[frame-1:frame])
         
-        point2.set_data([x2[frame-1]], [y2[frame-1]])
-        point2.set_3d_properties([z2[frame-1]])
-    
-    # Rotate view slightly for dynamic effect
-    ax.view_init(elev=20, azim=frame*0.5)
+        point2.set_data(x2[frame-1:frame], y2[frame-1:frame])
+        point2.set_3d_properties(z2[frame-1:frame])
     
     return line1, line2, point1, point2
 
+def rotate_view(step):
+    # Rotate view slowly on its own timer so the blitted frames stay cheap.
+    # Redraw now (not draw_idle) so the blit animation never caches the old view's background.
+    ax.view_init(elev=20, azim=step*20)
+    fig.canvas.draw()
+    return ()
+
 # Create animation
-anim = FuncAnimation(fig, update, init_func=init, frames=len(t), 
-                    interval=50, blit=True, repeat=True)
+anim = FuncAnimation(fig, update, frames=len(t), 
+                    interval=50, blit=True, repeat=True, cache_frame_data=False)
+
+# Slow camera rotation (full redraw, kept off the per-frame path)
+camera = FuncAnimation(fig, rotate_view, interval=2000, blit=False,
+                       cache_frame_data=False)
 
 plt.tight_layout()
 plt.show()
\ No newline at end of file
@@ -1,13 +1,20 @@
 """
 Simple STK + Gemini 
+
+The interpreter in STK_PYTHON_CMD needs the agi.stk12 package and numpy
+(generated scripts write AER tables with numpy.savetxt).
 """
 
+import argparse
+import collections
+import hashlib
 import os
+import re
 import tempfile
 import logging
 import subprocess
-from concurrent.futures import ThreadPoolExecutor
-from typing import List, Tuple
+import threading
+from typing import List, Optional, Tuple
 
 from google import genai 
 
@@ -18,8 +25,21 @@ GOOGLE_GEMINI_MODEL = os.getenv("GOOGLE_GEMINI_MODEL", "gemini-2.5-flash")
 # Python interpreter that can run STK scripts
 STK_PYTHON_CMD = os.getenv("STK_PYTHON_CMD", r"C:\Python314\python.exe")
 
-# Thread pool for running blocking STK jobs (kept for possible future expansion)
-WORKER_POOL = ThreadPoolExecutor(max_workers=2)
+# File types collected from the job directory after a run
+ARTIFACT_EXTS = (".csv", ".png", ".jpg", ".jpeg", ".pdf", ".txt", ".xlsx", ".xls")
+
+# Generated scripts are cached here, keyed by a hash of model + prompt
+GEMINI_CACHE_DIR = os.path.join(tempfile.gettempdir(), "stk_gemini_cache")
+
+# Number of trailing output lines kept from an STK run
+OUTPUT_TAIL_LINES = 200
+
+# Opening markdown fence line, whatever follows the backticks (```python, ``` py, ```)
+_FENCE_RE = re.compile(r"\A```[^\n]*\n")
+
+# Shared Gemini client (created on first use so its HTTP session is reused)
+_CLIENT: Optional[genai.Client] = None
+_CLIENT_LOCK = threading.Lock()
 
 # Logging (prints information to console)
 logging.basicConfig(level=logging.INFO)
@@ -33,11 +53,8 @@ def ensure_config_ok() -> None:
         raise RuntimeError("STK_PYTHON_CMD is not set. Set it in your environment.")
 
 
-def build_gemini_prompt(user_text: str) -> str:
-    """
-    Build a comprehensive instruction for Gemini to generate advanced STK automation code.
-    """
-    return f"""
+# Instruction sent to Gemini; literal braces are doubled for str.format
+_PROMPT_TEMPLATE = """
 You are an expert Python developer using AGI STK (Systems Tool Kit) v12+.
 The user will describe a complex scenario in natural language. Your job is to create a complete,
 production-ready STK automation script that handles ALL aspects mentioned.
@@ -49,15 +66,29 @@ REQUIRED BASE CLASS STRUCTURE:
 
 import csv
 import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from agi.stk12.stkdesktop import STKDesktop
 from agi.stk12.stkobjects import *
 
+# Report directories already created during this run
+_CREATED_DIRS = set()
+
+def _ensure_dir(path):
+    if path not in _CREATED_DIRS:
+        os.makedirs(path, exist_ok=True)
+        _CREATED_DIRS.add(path)
+
 class STKAutomation:
     def __init__(self, visible=True):
         print("[INFO] Launching STK...")
         try:
             self.app = STKDesktop.StartApplication(visible=visible)
             self.root = self.app.Root
+            self._provider_cache = {{}}
+            # CSV files are written in the background while STK keeps computing
+            self._report_pool = ThreadPoolExecutor(max_workers=2)
+            self._pending_reports = []
             print("[OK] STK Launched.")
         except Exception as e:
             print(f"[ERROR] Failed to launch STK: {{e}}")
@@ -143,16 +174,32 @@ class STKAutomation:
         print("[OK] Access computed.")
         return access
 
+    def _provider(self, access, name, group=None):
+        # Keyed by the access wrapper itself (no COM reads); the entry keeps it alive so its id stays unique
+        entry = self._provider_cache.get(id(access))
+        if entry is None:
+            entry = (access, access.DataProviders, {{}})
+            self._provider_cache[id(access)] = entry
+        providers = entry[2]
+        provider = providers.get((name, group))
+        if provider is None:
+            provider = entry[1].Item(name)
+            if group is not None:
+                provider = provider.Group.Item(group)
+            providers[(name, group)] = provider
+        return provider
+
     def get_access_intervals(self, access):
-        provider = access.DataProviders.Item("Access Intervals by Time")
-        result = provider.Exec()
+        provider = self._provider(access, "Access Intervals by Time")
+        result = provider.ExecElements(self.scenario.StartTime, self.scenario.StopTime,
+                                       ["Start Time", "Stop Time", "Duration"])
         return result
 
     def get_aer_data(self, access):
         print("[INFO] Getting AER (Azimuth, Elevation, Range) data...")
-        provider = access.DataProviders.Item("AER Data")
-        provider.PreData.SetTimeStep(60)
-        result = provider.Exec()
+        provider = self._provider(access, "AER Data", "Default")
+        result = provider.ExecElements(self.scenario.StartTime, self.scenario.StopTime, 60,
+                                       ["Time", "Azimuth", "Elevation", "Range"])
         print("[OK] AER data retrieved.")
         return result
 
@@ -177,47 +224,67 @@ class STKAutomation:
 
     def save_access_csv(self, result, file_path):
         print(f"[INFO] Saving access report to {{file_path}}...")
-        os.makedirs(os.path.dirname(file_path) if os.path.dirname(file_path) else ".", exist_ok=True)
+        _ensure_dir(os.path.dirname(file_path) or ".")
         ds = result.DataSets
-        start_times = ds.Item(0).GetValues()
-        stop_times = ds.Item(1).GetValues()
-        durations = ds.Item(2).GetValues()
-        with open(file_path, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["Start Time", "Stop Time", "Duration (sec)"])
-            for i in range(len(start_times)):
-                writer.writerow([start_times[i], stop_times[i], durations[i]])
-        print(f"[OK] Saved: {{file_path}}")
+        start_times, stop_times, durations = [ds.Item(i).GetValues() for i in range(ds.Count)]
+        self._submit_report(self._write_csv, file_path,
+                            ["Start Time", "Stop Time", "Duration (sec)"],
+                            zip(start_times, stop_times, durations))
 
     def save_aer_csv(self, result, file_path):
         print(f"[INFO] Saving AER report to {{file_path}}...")
-        os.makedirs(os.path.dirname(file_path) if os.path.dirname(file_path) else ".", exist_ok=True)
+        _ensure_dir(os.path.dirname(file_path) or ".")
         ds = result.DataSets
-        times = ds.Item(0).GetValues()
-        azimuths = ds.Item(1).GetValues()
-        elevations = ds.Item(2).GetValues()
-        ranges = ds.Item(3).GetValues()
-        with open(file_path, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["Time", "Azimuth (deg)", "Elevation (deg)", "Range (km)"])
-            for i in range(len(times)):
-                writer.writerow([times[i], azimuths[i], elevations[i], ranges[i]])
-        print(f"[OK] Saved: {{file_path}}")
+        times, azimuths, elevations, ranges = [ds.Item(i).GetValues() for i in range(ds.Count)]
+        self._submit_report(self._write_table, file_path,
+                            "Time,Azimuth (deg),Elevation (deg),Range (km)",
+                            (times, azimuths, elevations, ranges))
 
     def save_link_budget_csv(self, result, file_path):
         print(f"[INFO] Saving link budget to {{file_path}}...")
-        os.makedirs(os.path.dirname(file_path) if os.path.dirname(file_path) else ".", exist_ok=True)
+        _ensure_dir(os.path.dirname(file_path) or ".")
         ds = result.DataSets
-        times = ds.Item(0).GetValues()
-        eirp = ds.Item(1).GetValues()
-        path_loss = ds.Item(2).GetValues()
-        received_power = ds.Item(3).GetValues()
+        times, eirp, path_loss, received_power = [ds.Item(i).GetValues() for i in range(4)]
+        # Columns come from a plain Exec(), so their types are unknown: let csv.writer format them
+        self._submit_report(self._write_csv, file_path,
+                            ["Time", "EIRP (dBm)", "Path Loss (dB)", "Received Power (dBm)"],
+                            zip(times, eirp, path_loss, received_power))
+
+    def _write_csv(self, file_path, header, rows):
         with open(file_path, "w", newline="") as f:
             writer = csv.writer(f)
-            writer.writerow(["Time", "EIRP (dBm)", "Path Loss (dB)", "Received Power (dBm)"])
-            for i in range(len(times)):
-                writer.writerow([times[i], eirp[i], path_loss[i], received_power[i]])
-        print(f"[OK] Saved: {{file_path}}")
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    def _write_table(self, file_path, header, columns):
+        # Time strings and values share one object array; %s keeps the same output as csv.writer
+        table = np.empty((len(columns[0]), len(columns)), dtype=object)
+        for j, column in enumerate(columns):
+            table[:, j] = column
+        np.savetxt(file_path, table, fmt=",".join(["%s"] * len(columns)), header=header,
+                   comments="", newline="\\r\\n")
+
+    def _submit_report(self, write_fn, file_path, *args):
+        # Values are already pulled from STK on this (COM) thread; only file output runs in the pool
+        future = self._report_pool.submit(write_fn, file_path, *args)
+        self._pending_reports.append((file_path, future))
+
+    def wait_for_reports(self):
+        # Saved CSV files are only guaranteed to exist once this returns.
+        # Results are printed here, on the main thread, so they don't interleave with other output.
+        pending, self._pending_reports = self._pending_reports, []
+        if pending:
+            print(f"[INFO] Waiting for {{len(pending)}} report file(s) to finish writing...")
+        for file_path, future in pending:
+            future.result()
+            print(f"[OK] Saved: {{file_path}}")
+
+    def close(self):
+        # Drain pending CSV writes (re-raising any write error) and stop the worker threads
+        try:
+            self.wait_for_reports()
+        finally:
+            self._report_pool.shutdown()
 
     def take_screenshot(self, file_path, view_mode="2D"):
         print(f"[INFO] Taking screenshot: {{file_path}}...")
@@ -234,6 +301,7 @@ class STKAutomation:
 
 if __name__ == "__main__":
     print("\\n===== STK AUTOMATION STARTED =====\\n")
+    stk = None
     try:
         stk = STKAutomation(visible=True)
         # IMPLEMENT THE USER'S SCENARIO HERE
@@ -243,6 +311,10 @@ if __name__ == "__main__":
         print(f"[ERROR] Automation failed: {{e}}")
         import traceback
         traceback.print_exc()
+    finally:
+        # Runs even if a step above failed, so queued reports finish and write errors surface
+        if stk is not None:
+            stk.close()
     print("\\n===== STK AUTOMATION COMPLETED =====\\n")
 
 CRITICAL REQUIREMENTS:
@@ -263,6 +335,9 @@ CRITICAL REQUIREMENTS:
 7. If user mentions "India" or "Delhi", use approximate coordinates: Delhi ~ 28.6139°N, 77.2090°E.
 8. For GEO satellites watching a region, use set_geo_orbit() with appropriate longitude.
 9. Print [INFO] and [OK] messages for all major steps.
+10. Keep the try/except/finally block above: the finally clause calls stk.close(), which waits for all background CSV writes.
+11. save_*_csv() methods write in the background: a CSV file exists only after stk.wait_for_reports() (or stk.close()) returns.
+    Call stk.wait_for_reports() before reading, plotting or zipping any CSV the script saved.
 
 MOST IMPORTANT - OUTPUT FORMAT:
 - Output ONLY raw Python code starting from the first import statement.
@@ -277,36 +352,45 @@ User scenario description:
 """
 
 
+def build_gemini_prompt(user_text: str) -> str:
+    """
+    Build a comprehensive instruction for Gemini to generate advanced STK automation code.
+    """
+    return _PROMPT_TEMPLATE.format(user_text=user_text)
+
+
 def clean_gemini_code(raw_code: str) -> str:
     """
     Remove markdown code blocks if Gemini wrapped the code in them.
     Handles cases like: ```python ... ``` or ``` ... ```
     """
-    code = raw_code.strip()
-    
-    # Remove markdown code blocks (```python ... ``` or ``` ... ```)
-    if code.startswith("```"):
-        # Find the first newline after ```
-        first_newline = code.find("\n")
-        if first_newline != -1:
-            code = code[first_newline + 1:]
-        else:
-            code = code[3:]  # Remove just ```
-    
-    # Remove trailing ```
-    if code.endswith("```"):
-        code = code[:-3]
-    
+    code = _FENCE_RE.sub("", raw_code.strip()).removesuffix("```")
     return code.strip()
 
 
-def call_gemini_and_get_code(prompt: str) -> str:
+def _get_client() -> genai.Client:
+    """Return the shared Gemini client, creating it on first use."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = genai.Client(api_key=GOOGLE_API_KEY)
+        return _CLIENT
+
+
+def call_gemini_and_get_code(prompt: str, use_cache: bool = True) -> str:
     """
     Call Gemini 2.5 Flash using google-genai and return the generated code.
     Automatically cleans markdown code blocks if present.
+    Identical prompts are served from GEMINI_CACHE_DIR unless use_cache is False.
     """
-    client = genai.Client(api_key=GOOGLE_API_KEY)
-    response = client.models.generate_content(
+    key = hashlib.sha256(f"{GOOGLE_GEMINI_MODEL}\n{prompt}".encode("utf-8")).hexdigest()
+    cache_path = os.path.join(GEMINI_CACHE_DIR, key + ".py")
+    if use_cache and os.path.exists(cache_path):
+        print(f"[INFO] Using cached Gemini code: {cache_path}")
+        with open(cache_path, encoding="utf-8") as f:
+            return f.read()
+
+    response = _get_client().models.generate_content(
         model=GOOGLE_GEMINI_MODEL,
         contents=[{"role": "user", "parts": [{"text": prompt}]}],
     )
@@ -316,47 +400,84 @@ def call_gemini_and_get_code(prompt: str) -> str:
     
     # Clean markdown code blocks if present
     cleaned_code = clean_gemini_code(raw_code)
+
+    # The cache is best-effort: a read-only or full temp dir must not lose the generated code.
+    # Write to a temp file and rename it, so a failed or interrupted write never leaves a
+    # truncated script at cache_path.
+    tmp_path = None
+    try:
+        os.makedirs(GEMINI_CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=GEMINI_CACHE_DIR,
+                                         suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            f.write(cleaned_code)
+        os.replace(tmp_path, cache_path)
+        tmp_path = None
+    except OSError as e:
+        logger.warning("Could not cache Gemini code at %s: %s", cache_path, e)
+    finally:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
     return cleaned_code
 
 
-def run_stk_script(code: str) -> Tuple[str, List[str]]:
+def run_stk_script(code: str) -> Tuple[str, List[Tuple[str, int]]]:
     """
     Save the generated code to a temporary folder and run it with STK_PYTHON_CMD.
 
     Returns:
-      - combined stdout+stderr (string)
-      - list of artifact file paths (CSV / PNG) created by the script
+      - last OUTPUT_TAIL_LINES lines of combined stdout+stderr (string)
+      - list of (path, size in bytes) for artifacts (CSV / PNG) created by the script
     """
     work_dir = tempfile.mkdtemp(prefix="stk_job_")
-    script_path = os.path.join(work_dir, "generated_stk.py")
 
-    # Save the code to a file
-    with open(script_path, "w", encoding="utf-8") as f:
+    # Save the code to a file (closing it flushes before STK starts)
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", prefix="generated_stk_",
+                                     suffix=".py", dir=work_dir, delete=False) as f:
         f.write(code)
+        script_path = f.name
 
     print(f"\n[INFO] Saved generated code to: {script_path}")
     print(f"[INFO] Working directory: {work_dir}")
     print(f"[TIP] You can review the generated code at: {script_path}")
 
+    tail = collections.deque(maxlen=OUTPUT_TAIL_LINES)
     try:
-        proc = subprocess.run(
+        # The with block closes the pipe and reaps the process on every path
+        with subprocess.Popen(
             [STK_PYTHON_CMD, script_path],
             cwd=work_dir,
-            capture_output=True,
-            text=True,
-            timeout=15 * 60,  # 15 minutes
-        )
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            # Child writes UTF-8; undecodable bytes are replaced so the reader thread never dies
+            env={**os.environ, "PYTHONIOENCODING": "utf-8"},
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+        ) as proc:
+            # Drain output on a helper thread so the timeout below still applies
+            reader = threading.Thread(target=tail.extend, args=(proc.stdout,), daemon=True)
+            reader.start()
+            try:
+                proc.wait(timeout=15 * 60)  # 15 minutes
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                raise
+            finally:
+                # Finished or killed, the pipe reaches EOF and the reader returns
+                reader.join()
     except Exception as e:
         raise RuntimeError(f"Error running STK script: {e}")
 
     # Collect all artifacts (CSV, PNG, JPG, PDF, TXT, etc.)
-    artifacts: List[str] = []
-    for name in os.listdir(work_dir):
-        lower = name.lower()
-        if lower.endswith((".csv", ".png", ".jpg", ".jpeg", ".pdf", ".txt", ".xlsx", ".xls")):
-            artifacts.append(os.path.join(work_dir, name))
+    with os.scandir(work_dir) as entries:
+        artifacts = [(e.path, e.stat().st_size) for e in entries
+                     if e.name.lower().endswith(ARTIFACT_EXTS)]
 
-    output_text = proc.stdout + "\n" + proc.stderr
+    output_text = "".join(tail)
     return output_text, artifacts
 
 
@@ -372,6 +493,11 @@ def main() -> None:
     - Run STK script
     - Show artifacts and truncated output
     """
+    parser = argparse.ArgumentParser(description="STK + Gemini Automation CLI")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always ask Gemini, ignoring previously generated scripts")
+    args = parser.parse_args()
+
     ensure_config_ok()
 
     print("="*60)
@@ -408,7 +534,7 @@ def main() -> None:
     prompt = build_gemini_prompt(user_text)
 
     try:
-        generated_code = call_gemini_and_get_code(prompt)
+        generated_code = call_gemini_and_get_code(prompt, use_cache=not args.no_cache)
     except Exception as e:
         logger.exception("Error while calling Gemini")
         print(f"[ERROR] Error while calling Gemini: {e}")
@@ -426,8 +552,8 @@ def main() -> None:
         print("\n" + "="*60)
         print(f"[SUCCESS] STK job finished. Generated {len(artifacts)} file(s):")
         print("="*60)
-        for i, path in enumerate(artifacts, 1):
-            file_size = os.path.getsize(path) / 1024  # Size in KB
+        for i, (path, size) in enumerate(artifacts, 1):
+            file_size = size / 1024  # Size in KB
             print(f"  {i}. {os.path.basename(path)} ({file_size:.2f} KB)")
             print(f"     Full path: {path}")
         print("="*60)
@@ -3,6 +3,14 @@ import os
 from agi.stk12.stkdesktop import STKDesktop
 from agi.stk12.stkobjects import *
 
+# Report directories already created during this run
+_CREATED_DIRS = set()
+
+def _ensure_dir(path):
+    if path not in _CREATED_DIRS:
+        os.makedirs(path, exist_ok=True)
+        _CREATED_DIRS.add(path)
+
 class STKAutomation:
 
     def __init__(self, visible=True):
@@ -47,10 +55,8 @@ class STKAutomation:
         print("[OK] Access computed.")
 
         provider = access.DataProviders.Item("Access Intervals by Time")
-
-        
-
-        result = provider.Exec() 
+        result = provider.ExecElements(self.scenario.StartTime, self.scenario.StopTime,
+                                       ["Start Time", "Stop Time", "Duration"])
         print("[OK] Access computed.")
         return result 
     
@@ -58,21 +64,16 @@ class STKAutomation:
     def save_access_csv(self, result, file_path):
         print("[INFO] Extracting access data...")
         # Ensure directory exists
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        _ensure_dir(os.path.dirname(file_path) or ".")
 
 
         ds = result.DataSets
-
-        start_times = ds.Item(0).GetValues()
-        stop_times = ds.Item(1).GetValues()
-        durations  = ds.Item(2).GetValues()
+        start_times, stop_times, durations = [ds.Item(i).GetValues() for i in range(ds.Count)]
 
         with open(file_path, "w", newline="") as f:
             writer = csv.writer(f)
             writer.writerow(["Start Time", "Stop Time", "Duration"])
-
-            for i in range(len(start_times)):
-                writer.writerow([start_times[i], stop_times[i], durations[i]])
+            writer.writerows(zip(start_times, stop_times, durations))
 
         print(f"[OK] Saved access report: {file_path}")
         